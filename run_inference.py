@@ -1,14 +1,13 @@
 import os
 import pickle
+import numpy as np
 import pandas as pd
 import time
-from tqdm import tqdm
 
-from src.chunking import chunk_text
 from src.embeddings import embed_texts
-from src.retrieval import VectorStore
-from src.contradiction import contradiction_score
-from src.aggregation import aggregate_scores
+from src.novels import build_novel_stores
+from src.contradiction import create_contradiction_prompt, score_responses
+from src.aggregation import aggregate_scores_by_example, FEATURE_COLUMNS
 from src.gemini_llm import gemini_call_batch
 
 
@@ -17,42 +16,10 @@ MODEL_DIR = "models"
 OUTPUT_FILE = "submission.csv"
 
 
-def load_novel(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
-
-
-def build_vector_store(novel_text):
-    chunks = chunk_text(novel_text)
-    embeddings = embed_texts(chunks)
-    store = VectorStore(embedding_dim=len(embeddings[0]))
-    store.add(embeddings, chunks)
-    return store
-
-
 def split_backstory(backstory):
     return [s.strip() for s in backstory.split(".") if len(s.strip()) > 5]
 
 
-def create_contradiction_prompt(claim, evidence):
-    """Create evidence-grounded prompt per problem statement guidelines"""
-    return f"""You are a logical consistency checker.
-
-Claim:
-{claim}
-
-Novel Evidence:
-{evidence}
-
-Instructions:
-- Use ONLY the provided evidence.
-- Do NOT infer missing facts.
-- If the evidence is insufficient, answer NEUTRAL.
-
-Respond with exactly ONE word:
-CONTRADICT, SUPPORT, or NEUTRAL"""
-
-
 def main():
     print("="*60)
     print("🚀 KDSH'26 Track A - Optimized Inference")
@@ -72,82 +39,75 @@ def main():
     # Load novels
     print("\n[2/5] 📚 Loading and processing novels...")
     novel_start = time.time()
-    novels = {
-        "castaways": build_vector_store(
-            load_novel(os.path.join(DATA_DIR, "Books", "In search of the castaways.txt"))
-        ),
-        "monte_cristo": build_vector_store(
-            load_novel(os.path.join(DATA_DIR, "Books", "The Count of Monte Cristo.txt"))
-        )
-    }
+    novels = build_novel_stores(DATA_DIR)
     novel_time = time.time() - novel_start
     print(f"      ✓ Completed in {novel_time/60:.1f} minutes")
     
     # Prepare all prompts
     print("\n[3/5] 🔍 Retrieving evidence and preparing prompts...")
-    all_prompts = []
-    prompt_metadata = []
-    
-    with tqdm(total=len(test_df), desc="      Processing examples",
-              bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]') as pbar:
-        for idx, row in test_df.iterrows():
-            backstory = row["content"]
-            book_name = row["book_name"].lower()
-            book = "castaways" if "castaways" in book_name else "monte_cristo"
-            
-            claims = split_backstory(backstory)
-            store = novels[book]
-            
-            for claim in claims:
-                claim_emb = embed_texts([claim])[0]
-                evidence_chunks = store.search(claim_emb, k=5)
-                
-                for evidence in evidence_chunks:
-                    prompt = create_contradiction_prompt(claim, evidence)
-                    all_prompts.append(prompt)
-                    prompt_metadata.append({'example_idx': idx})
-            pbar.update(1)
+    # Pass 1: split every backstory into flat, column-wise claim lists
+    claim_example_ids = []
+    claim_books = []
+    claims = []
+    books = np.where(
+        test_df["book_name"].str.lower().str.contains("castaways", regex=False), "castaways", "monte_cristo"
+    )
+    for idx, backstory, book in zip(test_df.index, test_df["content"].to_numpy(), books):
+        for claim in split_backstory(backstory):
+            claim_example_ids.append(idx)
+            claim_books.append(book)
+            claims.append(claim)
+    claim_books = np.array(claim_books)
+    
+    # Pass 2: embed all claims in a single batched call
+    claim_embs = embed_texts(claims, batch_size=64)
+    
+    # Pass 3: one batched search per book over that book's claim matrix
+    claim_evidence = [None] * len(claims)
+    for book, store in novels.items():
+        positions = np.flatnonzero(claim_books == book)
+        if positions.size == 0:
+            continue
+        for i, evidence_chunks in zip(positions, store.search(claim_embs[positions], k=5)):
+            claim_evidence[i] = evidence_chunks
+    
+    # Pass 4: build prompts in one pass; example ids fan out to one per prompt
+    prompt_example_ids = np.repeat(
+        claim_example_ids, [len(evidence_chunks) for evidence_chunks in claim_evidence]
+    )
+    all_prompts = [
+        create_contradiction_prompt(claim, evidence)
+        for claim, evidence_chunks in zip(claims, claim_evidence)
+        for evidence in evidence_chunks
+    ]
     
     print(f"      ✓ Prepared {len(all_prompts)} prompts")
     
+    # Identical (claim, evidence) pairs only need one API call
+    unique_prompts = list(dict.fromkeys(all_prompts))
+    print(f"      ℹ️  {len(unique_prompts)} unique prompts "
+          f"({1 - len(unique_prompts)/max(len(all_prompts), 1):.0%} duplicates skipped)")
+    
     # Batch process
     print("\n[4/5] 🤖 Processing LLM calls...")
-    estimated_minutes = (len(all_prompts) * 5) / (3 * 60)
+    estimated_minutes = (len(unique_prompts) * 5) / (3 * 60)
     print(f"      Estimated time: ~{estimated_minutes:.1f} minutes")
     
     llm_start = time.time()
-    all_responses = gemini_call_batch(all_prompts, max_workers=3)
+    unique_responses = gemini_call_batch(unique_prompts, max_workers=3)
+    response_lookup = dict(zip(unique_prompts, unique_responses))
+    all_responses = [response_lookup[p] for p in all_prompts]
     llm_time = time.time() - llm_start
     
     print(f"\n      ✓ Completed in {llm_time/60:.1f} minutes")
     
     # Aggregate and predict
     print("\n[5/5] 📈 Aggregating and making predictions...")
-    example_scores = {}
-    
-    with tqdm(total=len(all_responses), desc="      Aggregating",
-              bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]') as pbar:
-        for meta, response in zip(prompt_metadata, all_responses):
-            idx = meta['example_idx']
-            # Parse response
-            mapping = {"CONTRADICT": 1.0, "NEUTRAL": 0.3, "SUPPORT": 0.0}
-            score = mapping.get(response.strip().upper(), 0.3)
-            
-            if idx not in example_scores:
-                example_scores[idx] = []
-            example_scores[idx].append(score)
-            pbar.update(1)
-    
-    predictions = []
-    for idx in sorted(example_scores.keys()):
-        aggregated = aggregate_scores(example_scores[idx])
-        feature_vector = [[
-            aggregated["max_score"],
-            aggregated["mean_score"],
-            aggregated["contradiction_count"]
-        ]]
-        label = int(clf.predict(feature_vector)[0])
-        predictions.append(label)
+    scores = score_responses(all_responses)
+    example_features = aggregate_scores_by_example(prompt_example_ids, scores)
+    
+    # One predict over the (n_examples, 3) feature matrix
+    predictions = clf.predict(example_features[FEATURE_COLUMNS].to_numpy()).astype(int).tolist()
     
     print(f"      ✓ Generated {len(predictions)} predictions")
     
@@ -170,7 +130,7 @@ def main():
     print(f"    " + "-"*35)
     print(f"    Total time:          {total_time/60:>6.1f} min")
     print(f"\n📄 Results saved to: {OUTPUT_FILE}")
-    print(f"💰 API calls made: {len(all_prompts)}")
+    print(f"💰 API calls made: {len(unique_prompts)}")
     print("="*60)
 
 
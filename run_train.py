@@ -1,14 +1,13 @@
 import os
 import pickle
+import numpy as np
 import pandas as pd
 import time
-from tqdm import tqdm
 
-from src.chunking import chunk_text
 from src.embeddings import embed_texts
-from src.retrieval import VectorStore
-from src.contradiction import contradiction_score
-from src.aggregation import aggregate_scores
+from src.novels import build_novel_stores
+from src.contradiction import create_contradiction_prompt, score_responses
+from src.aggregation import aggregate_scores_by_example, FEATURE_COLUMNS
 from src.train_classifier import train_classifier
 from src.gemini_llm import gemini_call_batch
 
@@ -18,42 +17,10 @@ MODEL_DIR = "models"
 os.makedirs(MODEL_DIR, exist_ok=True)
 
 
-def load_novel(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
-
-
-def build_vector_store(novel_text):
-    chunks = chunk_text(novel_text)
-    embeddings = embed_texts(chunks)
-    store = VectorStore(embedding_dim=len(embeddings[0]))
-    store.add(embeddings, chunks)
-    return store
-
-
 def split_backstory(backstory):
     return [s.strip() for s in backstory.split(".") if len(s.strip()) > 5]
 
 
-def create_contradiction_prompt(claim, evidence):
-    """Create evidence-grounded prompt per problem statement guidelines"""
-    return f"""You are a logical consistency checker.
-
-Claim:
-{claim}
-
-Novel Evidence:
-{evidence}
-
-Instructions:
-- Use ONLY the provided evidence.
-- Do NOT infer missing facts.
-- If the evidence is insufficient, answer NEUTRAL.
-
-Respond with exactly ONE word:
-CONTRADICT, SUPPORT, or NEUTRAL"""
-
-
 def main():
     print("="*60)
     print("🚀 KDSH'26 Track A - Optimized Training")
@@ -71,97 +38,85 @@ def main():
     print("      This will take 2-5 minutes depending on hardware")
     
     novel_start = time.time()
-    novels = {
-        "castaways": build_vector_store(
-            load_novel(os.path.join(DATA_DIR, "Books", "In search of the castaways.txt"))
-        ),
-        "monte_cristo": build_vector_store(
-            load_novel(os.path.join(DATA_DIR, "Books", "The Count of Monte Cristo.txt"))
-        )
-    }
+    novels = build_novel_stores(DATA_DIR)
     novel_time = time.time() - novel_start
     print(f"      ✓ Completed in {novel_time/60:.1f} minutes")
     
     # Prepare all prompts for batch processing
     print("\n[3/6] 🔍 Retrieving evidence and preparing prompts...")
-    all_prompts = []
-    prompt_metadata = []  # Track which example/claim each prompt belongs to
-    
     start_prep = time.time()
     
-    with tqdm(total=len(train_df), desc="      Processing examples", 
-              bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]') as pbar:
-        for idx, row in train_df.iterrows():
-            backstory = row["content"]
-            book_name = row["book_name"].lower()
-            book = "castaways" if "castaways" in book_name else "monte_cristo"
-            
-            claims = split_backstory(backstory)
-            store = novels[book]
-            
-            for claim in claims:
-                # Retrieve evidence chunks for this claim
-                claim_emb = embed_texts([claim])[0]
-                evidence_chunks = store.search(claim_emb, k=5)
-                
-                for evidence in evidence_chunks:
-                    prompt = create_contradiction_prompt(claim, evidence)
-                    all_prompts.append(prompt)
-                    prompt_metadata.append({
-                        'example_idx': idx,
-                        'claim': claim,
-                        'evidence': evidence
-                    })
-            pbar.update(1)
+    # Pass 1: split every backstory into flat, column-wise claim lists
+    claim_example_ids = []
+    claim_books = []
+    claims = []
+    books = np.where(
+        train_df["book_name"].str.lower().str.contains("castaways", regex=False), "castaways", "monte_cristo"
+    )
+    for idx, backstory, book in zip(train_df.index, train_df["content"].to_numpy(), books):
+        for claim in split_backstory(backstory):
+            claim_example_ids.append(idx)
+            claim_books.append(book)
+            claims.append(claim)
+    claim_books = np.array(claim_books)
+    
+    # Pass 2: embed all claims in a single batched call
+    claim_embs = embed_texts(claims, batch_size=64)
+    
+    # Pass 3: one batched search per book over that book's claim matrix
+    claim_evidence = [None] * len(claims)
+    for book, store in novels.items():
+        positions = np.flatnonzero(claim_books == book)
+        if positions.size == 0:
+            continue
+        for i, evidence_chunks in zip(positions, store.search(claim_embs[positions], k=5)):
+            claim_evidence[i] = evidence_chunks
+    
+    # Pass 4: build prompts in one pass; example ids fan out to one per prompt
+    prompt_example_ids = np.repeat(
+        claim_example_ids, [len(evidence_chunks) for evidence_chunks in claim_evidence]
+    )
+    all_prompts = [
+        create_contradiction_prompt(claim, evidence)
+        for claim, evidence_chunks in zip(claims, claim_evidence)
+        for evidence in evidence_chunks
+    ]
     
     prep_time = time.time() - start_prep
     print(f"      ✓ Prepared {len(all_prompts)} prompts in {prep_time:.1f}s")
     print(f"      ℹ️  Average: {len(all_prompts)/len(train_df):.1f} prompts per example")
     
+    # Identical (claim, evidence) pairs only need one API call
+    unique_prompts = list(dict.fromkeys(all_prompts))
+    print(f"      ℹ️  {len(unique_prompts)} unique prompts "
+          f"({1 - len(unique_prompts)/max(len(all_prompts), 1):.0%} duplicates skipped)")
+    
     # Batch process all prompts with rate limiting
     print("\n[4/6] 🤖 Processing LLM calls (this is the longest step)...")
-    estimated_minutes = (len(all_prompts) * 5) / (3 * 60)  # 3 workers, ~5s per call
+    estimated_minutes = (len(unique_prompts) * 5) / (3 * 60)  # 3 workers, ~5s per call
     print(f"      Estimated time: ~{estimated_minutes:.1f} minutes")
-    print(f"      Total API calls: {len(all_prompts)}")
+    print(f"      Total API calls: {len(unique_prompts)}")
     print(f"      Free tier safe: ✓ (rate limited to 12 RPM)")
     
     start_llm = time.time()
     
     # Use max_workers=3 for free tier to avoid rate limits
-    all_responses = gemini_call_batch(all_prompts, max_workers=3)
+    unique_responses = gemini_call_batch(unique_prompts, max_workers=3)
+    response_lookup = dict(zip(unique_prompts, unique_responses))
+    all_responses = [response_lookup[p] for p in all_prompts]
     
     llm_time = time.time() - start_llm
-    print(f"\n      ✓ Completed {len(all_prompts)} API calls in {llm_time/60:.1f} minutes")
-    print(f"      ℹ️  Average: {llm_time/len(all_prompts):.2f}s per call")
+    print(f"\n      ✓ Completed {len(unique_prompts)} API calls in {llm_time/60:.1f} minutes")
+    print(f"      ℹ️  Average: {llm_time/max(len(unique_prompts), 1):.2f}s per call")
     
     # Aggregate results by example
     print("\n[5/6] 📈 Aggregating evidence scores...")
-    features = []
-    labels = []
-    
-    example_scores = {}  # Group scores by example index
-    
-    with tqdm(total=len(all_responses), desc="      Aggregating",
-              bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]') as pbar:
-        for meta, response in zip(prompt_metadata, all_responses):
-            idx = meta['example_idx']
-            score = contradiction_score(lambda p: response, meta['claim'], meta['evidence'])
-            
-            if idx not in example_scores:
-                example_scores[idx] = []
-            example_scores[idx].append(score)
-            pbar.update(1)
-    
-    # Create feature vectors
-    for idx in sorted(example_scores.keys()):
-        aggregated = aggregate_scores(example_scores[idx])
-        features.append([
-            aggregated["max_score"],
-            aggregated["mean_score"],
-            aggregated["contradiction_count"]
-        ])
-        label = 1 if train_df.iloc[idx]["label"] == "consistent" else 0
-        labels.append(label)
+    scores = score_responses(all_responses)
+    example_features = aggregate_scores_by_example(prompt_example_ids, scores)
+    
+    features = example_features[FEATURE_COLUMNS].to_numpy()
+    example_labels = train_df["label"].iloc[example_features.index.to_numpy()]
+    labels = (example_labels == "consistent").astype(int).to_numpy()
     
     print(f"      ✓ Created {len(features)} feature vectors")
     
@@ -186,7 +141,7 @@ def main():
     print(f"    LLM processing:      {llm_time/60:>6.1f} min")
     print(f"    " + "-"*35)
     print(f"    Total time:          {total_time/60:>6.1f} min")
-    print(f"\n💰 API Usage: {len(all_prompts)} calls")
+    print(f"\n💰 API Usage: {len(unique_prompts)} calls")
     print("="*60)
 
 
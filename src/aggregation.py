@@ -1,4 +1,10 @@
 import numpy as np
+import pandas as pd
+
+FEATURE_COLUMNS = ["max_score", "mean_score", "contradiction_count"]
+
+# Scores above this count as a strong contradiction
+CONTRADICTION_THRESHOLD = 0.7
 
 
 def aggregate_scores(scores):
@@ -6,15 +12,31 @@ def aggregate_scores(scores):
     Conservative aggregation:
     one strong contradiction dominates.
     """
-    if not scores:
+    arr = np.asarray(scores, dtype=np.float64)
+    if arr.size == 0:
         return 0.0
 
-    max_score = max(scores)
-    mean_score = np.mean(scores)
-    contradiction_count = sum(s > 0.7 for s in scores)
-
     return {
-        "max_score": max_score,
-        "mean_score": mean_score,
-        "contradiction_count": contradiction_count
+        "max_score": float(arr.max()),
+        "mean_score": float(arr.mean()),
+        "contradiction_count": int((arr > CONTRADICTION_THRESHOLD).sum())
     }
+
+
+def aggregate_scores_by_example(example_ids, scores):
+    """
+    Vectorized counterpart of aggregate_scores: computes the same three
+    features for every example in one groupby.
+    Returns a DataFrame indexed by example id (sorted) with FEATURE_COLUMNS.
+    """
+    df = pd.DataFrame({
+        "example_idx": example_ids,
+        "score": np.asarray(scores, dtype=np.float64)
+    })
+    df["contradiction"] = df["score"] > CONTRADICTION_THRESHOLD
+
+    return df.groupby("example_idx", sort=True).agg(
+        max_score=("score", "max"),
+        mean_score=("score", "mean"),
+        contradiction_count=("contradiction", "sum")
+    )
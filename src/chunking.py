@@ -1,6 +1,20 @@
 import nltk
+import numpy as np
 from nltk.tokenize import sent_tokenize
 
+from src.embeddings import tokenizer, MAX_CHUNK_TOKENS
+
+try:
+    from numba import njit
+except ImportError:
+    print("⚠️  numba not available, chunk boundaries run in plain Python")
+
+    def njit(*args, **kwargs):
+        # Plain-Python fallback with the same decorator signature
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
 # Download required NLTK data
 try:
     nltk.data.find('tokenizers/punkt_tab')
@@ -8,33 +22,65 @@ except LookupError:
     nltk.download("punkt_tab", quiet=True)
 
 
-def chunk_text(text, max_tokens=800, overlap=100):
+def count_tokens(sentences):
     """
-    Splits long text into overlapping chunks based on sentence boundaries.
+    Counts embedding-model tokens per sentence in one batched tokenizer call.
     """
-    sentences = sent_tokenize(text)
-    chunks = []
+    if not sentences:
+        return []
+    encoded = tokenizer(sentences, add_special_tokens=False, verbose=False)
+    return [len(ids) for ids in encoded["input_ids"]]
 
-    current_chunk = []
+
+@njit(cache=True)
+def chunk_boundaries(lens, max_tokens, overlap):
+    """
+    Walks per-sentence token counts and returns an (n_chunks, 2) array of
+    [start, end) sentence indices. Each new chunk re-uses the trailing
+    sentences of the previous one whose total length is <= overlap.
+    """
+    n = lens.shape[0]
+    bounds = np.empty((n, 2), dtype=np.int64)
+    count = 0
+    start = 0
     current_len = 0
 
-    for sent in sentences:
-        tokens = sent.split()
-        sent_len = len(tokens)
+    for i in range(n):
+        if current_len + lens[i] > max_tokens and i > start:
+            bounds[count, 0] = start
+            bounds[count, 1] = i
+            count += 1
+
+            # Always advance past the previous start so chunks make progress
+            new_start = i
+            carried = 0
+            while new_start > start + 1 and carried + lens[new_start - 1] <= overlap:
+                new_start -= 1
+                carried += lens[new_start]
+            start = new_start
+            current_len = carried
+
+        current_len += lens[i]
+
+    if start < n:
+        bounds[count, 0] = start
+        bounds[count, 1] = n
+        count += 1
 
-        if current_len + sent_len > max_tokens:
-            chunks.append(" ".join(current_chunk))
-            if overlap > 0:
-                current_chunk = current_chunk[-overlap:]
-                current_len = len(" ".join(current_chunk).split())
-            else:
-                current_chunk = []
-                current_len = 0
+    return bounds[:count]
 
-        current_chunk.append(sent)
-        current_len += sent_len
 
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
+def chunk_text(text, max_tokens=MAX_CHUNK_TOKENS, overlap=100):
+    """
+    Splits long text into overlapping chunks based on sentence boundaries.
+    max_tokens is capped at the encoder's sequence length, so no part of a
+    chunk is truncated away before embedding.
+    """
+    max_tokens = min(max_tokens, MAX_CHUNK_TOKENS)
+    sentences = sent_tokenize(text)
+    sentence_lens = np.asarray(count_tokens(sentences), dtype=np.int64)
 
-    return chunks
\ No newline at end of file
+    return [
+        " ".join(sentences[start:end])
+        for start, end in chunk_boundaries(sentence_lens, max_tokens, overlap)
+    ]
@@ -1,33 +1,57 @@
+import pandas as pd
+
+# Prompt split around its two substitution points and built by plain
+# concatenation, which is cheaper than formatting for tens of thousands of calls
+_PROMPT_HEAD = "You are a logical consistency checker.\n\nClaim:\n"
+_PROMPT_MIDDLE = "\n\nNovel Evidence:\n"
+_PROMPT_TAIL = (
+    "\n\n"
+    "Instructions:\n"
+    "- Use ONLY the provided evidence.\n"
+    "- Do NOT infer missing facts.\n"
+    "- If the evidence is insufficient, answer NEUTRAL.\n"
+    "\n"
+    "Respond with exactly ONE word:\n"
+    "CONTRADICT, SUPPORT, or NEUTRAL"
+)
+
+
+# LLM label -> contradiction score; anything unparseable counts as NEUTRAL
+SCORE_MAPPING = {
+    "CONTRADICT": 1.0,
+    "NEUTRAL": 0.3,
+    "SUPPORT": 0.0
+}
+
+
+def create_contradiction_prompt(claim, evidence):
+    """Create evidence-grounded prompt per problem statement guidelines"""
+    return _PROMPT_HEAD + claim + _PROMPT_MIDDLE + evidence + _PROMPT_TAIL
+
+
 def contradiction_score(llm_call, claim, evidence):
     """
     Uses an LLM to classify contradiction vs support vs neutral.
     The llm_call function should return raw text output.
     """
 
-    prompt = f"""
-You are a logical consistency checker.
-
-Claim:
-{claim}
-
-Novel Evidence:
-{evidence}
-
-Instructions:
-- Use ONLY the provided evidence.
-- Do NOT infer missing facts.
-- If the evidence is insufficient, answer NEUTRAL.
-
-Respond with exactly ONE word:
-CONTRADICT, SUPPORT, or NEUTRAL
-"""
+    prompt = create_contradiction_prompt(claim, evidence)
 
     response = llm_call(prompt).strip().upper()
 
-    mapping = {
-        "CONTRADICT": 1.0,
-        "NEUTRAL": 0.3,
-        "SUPPORT": 0.0
-    }
+    return SCORE_MAPPING.get(response, SCORE_MAPPING["NEUTRAL"])
 
-    return mapping.get(response, 0.3)
+
+def score_responses(responses):
+    """
+    Vectorized counterpart of contradiction_score for a batch of raw
+    LLM responses. Returns a float numpy array aligned with responses.
+    """
+    return (
+        pd.Series(responses, dtype=object)
+        .str.strip()
+        .str.upper()
+        .map(SCORE_MAPPING)
+        .fillna(SCORE_MAPPING["NEUTRAL"])
+        .to_numpy(dtype=float)
+    )
@@ -1,5 +1,6 @@
 from sentence_transformers import SentenceTransformer
 import numpy as np
+import platform
 
 try:
     import torch
@@ -22,6 +23,58 @@ else:
 
 _model = SentenceTransformer(MODEL_NAME, device=DEVICE)
 
+# Half precision on GPU: BF16 on Ampere+, FP16 otherwise.
+# is_bf16_supported() also reports emulated BF16 on pre-Ampere cards (T4,
+# V100), which has no tensor-core path, so gate on compute capability.
+if DEVICE == "cuda":
+    if torch.cuda.get_device_capability(0)[0] >= 8:
+        _model = _model.to(torch.bfloat16)
+        MODEL_DTYPE = "bfloat16"
+    else:
+        _model = _model.half()
+        MODEL_DTYPE = "float16"
+    print(f"⚡ Running embeddings in {MODEL_DTYPE}")
+else:
+    MODEL_DTYPE = "float32"
+
+# Compile the transformer on GPU so LayerNorm/GeLU/matmul kernels get fused.
+# Needs Triton (not available on Windows). Compilation is lazy, so failures
+# show up in embed_texts, which then restores the eager module kept here;
+# the process-wide Dynamo settings are left untouched.
+_eager_auto_model = None
+if DEVICE == "cuda" and hasattr(torch, "compile") and platform.system() != "Windows":
+    _transformer = _model._first_module()
+    _eager_auto_model = _transformer.auto_model
+    _transformer.auto_model = torch.compile(_eager_auto_model, dynamic=True)
+    print("⚡ Embedding model will be compiled with torch.compile on first use "
+          "(falls back to eager on errors)")
+
+# The model's own WordPiece tokenizer, for token-accurate chunking
+tokenizer = _model.tokenizer
+
+# Longest chunk the encoder sees without truncation ([CLS]/[SEP] excluded)
+MAX_CHUNK_TOKENS = _model.max_seq_length - 2
+
+
+def set_torch_threads(num_threads):
+    """
+    Caps PyTorch intra-op threads, e.g. in one of several worker processes
+    sharing the CPU.
+    """
+    if TORCH_AVAILABLE:
+        torch.set_num_threads(num_threads)
+
+
+def _encode(texts, batch_size):
+    return _model.encode(
+        texts,
+        batch_size=batch_size,
+        show_progress_bar=True,
+        normalize_embeddings=False,
+        convert_to_numpy=True,
+        device=DEVICE
+    ).astype(np.float32, copy=False)  # FAISS expects float32
+
 
 def embed_texts(texts, batch_size=32):
     """
@@ -32,18 +85,27 @@ def embed_texts(texts, batch_size=32):
         batch_size: Batch size for encoding
     
     Returns:
-        numpy array of normalized embeddings
+        float32 numpy array of normalized embeddings
     """
+    global _eager_auto_model
+    
     print(f"\n🔢 Embedding {len(texts)} chunks on {DEVICE.upper()}...")
     
-    embeddings = _model.encode(
-        texts,
-        batch_size=batch_size,
-        show_progress_bar=True,
-        normalize_embeddings=True,
-        convert_to_numpy=True,
-        device=DEVICE
-    )
+    try:
+        embeddings = _encode(texts, batch_size)
+    except Exception as e:
+        if _eager_auto_model is None:
+            raise
+        # Only this model drops back to eager; retry once without compilation
+        print(f"\n⚠️  torch.compile failed ({type(e).__name__}: {e}), falling back to eager")
+        _model._first_module().auto_model = _eager_auto_model
+        _eager_auto_model = None
+        embeddings = _encode(texts, batch_size)
+    
+    # Normalize in FP32 on the host: normalizing the BF16/FP16 output on the
+    # GPU leaves norms off by ~2^-8, which skews inner-product scores
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings /= np.maximum(norms, 1e-12)
     
     if DEVICE == "cuda" and TORCH_AVAILABLE:
         print(f"⚡ GPU Memory Used: {torch.cuda.memory_allocated(0) / 1e9:.2f} GB")
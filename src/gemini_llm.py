@@ -1,9 +1,11 @@
 import os
+import hashlib
+import sqlite3
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
 from tqdm import tqdm
 import threading
 
@@ -21,6 +23,7 @@ if not api_key:
 
 # Initialize the client
 client = genai.Client(api_key=api_key)
+MODEL_NAME = 'gemini-2.0-flash-exp'
 
 # Rate limiting for free tier (15 RPM = 1 request per 4 seconds to be safe)
 class RateLimiter:
@@ -40,6 +43,55 @@ class RateLimiter:
 rate_limiter = RateLimiter(calls_per_minute=12)
 
 
+# asyncio counterpart of RateLimiter; create one per event loop
+class AsyncRateLimiter:
+    def __init__(self, calls_per_minute=12):
+        self.calls_per_minute = calls_per_minute
+        self.min_interval = 60.0 / calls_per_minute
+        self.last_call = 0
+        self.lock = asyncio.Lock()
+    
+    async def wait_if_needed(self):
+        async with self.lock:
+            elapsed = time.time() - self.last_call
+            if elapsed < self.min_interval:
+                await asyncio.sleep(self.min_interval - elapsed)
+            self.last_call = time.time()
+
+
+# Persistent response cache so reruns skip prompts that were already answered
+class ResponseCache:
+    def __init__(self, path=os.path.join("models", "llm_cache.sqlite")):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT)"
+        )
+        self.conn.commit()
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def key(prompt):
+        return hashlib.sha256(f"{MODEL_NAME}\n{prompt}".encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def set(self, key, response):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)",
+                (key, response)
+            )
+            self.conn.commit()
+
+response_cache = ResponseCache()
+
+
 def gemini_call(prompt, max_retries=3):
     """
     Calls Google Gemini API with retry logic and rate limiting.
@@ -51,20 +103,27 @@ def gemini_call(prompt, max_retries=3):
     Returns:
         API response text or "NEUTRAL" on error
     """
+    cache_key = response_cache.key(prompt)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     for attempt in range(max_retries):
         try:
             # Rate limiting to stay within free tier
             rate_limiter.wait_if_needed()
             
             response = client.models.generate_content(
-                model='gemini-2.0-flash-exp',
+                model=MODEL_NAME,
                 contents=prompt,
                 config=types.GenerateContentConfig(
                     temperature=0.0,
                     max_output_tokens=50,  # Short responses to save quota
                 )
             )
-            return response.text.strip()
+            text = response.text.strip()
+            response_cache.set(cache_key, text)
+            return text
         except Exception as e:
             if attempt < max_retries - 1:
                 wait_time = 2 ** attempt  # Exponential backoff
@@ -78,13 +137,60 @@ def gemini_call(prompt, max_retries=3):
     return "NEUTRAL"
 
 
-def gemini_call_batch(prompts, max_workers=3, show_progress=True):
+async def gemini_call_async(prompt, limiter=None, max_retries=3):
+    """
+    Async variant of gemini_call using the client's aio interface.
+    
+    Args:
+        prompt: The prompt text
+        limiter: Optional AsyncRateLimiter shared by concurrent calls
+        max_retries: Number of retry attempts
+    
+    Returns:
+        API response text or "NEUTRAL" on error
+    """
+    cache_key = response_cache.key(prompt)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    for attempt in range(max_retries):
+        try:
+            # Rate limiting to stay within free tier
+            if limiter is not None:
+                await limiter.wait_if_needed()
+            
+            response = await client.aio.models.generate_content(
+                model=MODEL_NAME,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    temperature=0.0,
+                    max_output_tokens=50,  # Short responses to save quota
+                )
+            )
+            text = response.text.strip()
+            response_cache.set(cache_key, text)
+            return text
+        except Exception as e:
+            if attempt < max_retries - 1:
+                wait_time = 2 ** attempt  # Exponential backoff
+                print(f"\nAPI Error (retry {attempt+1}/{max_retries}): {e}")
+                print(f"Waiting {wait_time}s before retry...")
+                await asyncio.sleep(wait_time)
+            else:
+                print(f"\nAPI Error (final): {e}")
+                return "NEUTRAL"
+    
+    return "NEUTRAL"
+
+
+async def gemini_call_batch_async(prompts, max_workers=3, show_progress=True):
     """
-    Process prompts with controlled parallelism for free tier.
+    Process prompts concurrently on one event loop for free tier.
     
     Args:
         prompts: List of prompt strings
-        max_workers: Max concurrent requests (keep low for free tier)
+        max_workers: Max in-flight requests (keep low for free tier)
         show_progress: Show progress bar
     
     Returns:
@@ -95,43 +201,64 @@ def gemini_call_batch(prompts, max_workers=3, show_progress=True):
     
     results = [None] * len(prompts)
     start_time = time.time()
+    semaphore = asyncio.Semaphore(max_workers)
+    limiter = AsyncRateLimiter(calls_per_minute=12)
     
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_idx = {
-            executor.submit(gemini_call, prompt): idx 
-            for idx, prompt in enumerate(prompts)
-        }
-        
-        pbar = tqdm(
-            total=len(prompts), 
-            desc="      API calls",
-            bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]',
-            disable=not show_progress,
-            ncols=80
-        )
-        
-        completed = 0
-        for future in as_completed(future_to_idx):
-            idx = future_to_idx[future]
+    async def call(idx, prompt):
+        async with semaphore:
             try:
-                results[idx] = future.result()
+                return idx, await gemini_call_async(prompt, limiter)
             except Exception as e:
                 print(f"\n      ❌ Error processing prompt {idx}: {e}")
-                results[idx] = "NEUTRAL"
-            
-            completed += 1
-            pbar.update(1)
-            
-            # Update estimate every 10 completions
-            if completed % 10 == 0:
-                elapsed = time.time() - start_time
-                rate = completed / elapsed
-                remaining = (len(prompts) - completed) / rate if rate > 0 else 0
-                pbar.set_postfix({
-                    'ETA': f'{remaining/60:.1f}m',
-                    'Rate': f'{rate:.1f}/s'
-                }, refresh=True)
+                return idx, "NEUTRAL"
+    
+    pbar = tqdm(
+        total=len(prompts), 
+        desc="      API calls",
+        bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]',
+        disable=not show_progress,
+        ncols=80
+    )
+    
+    completed = 0
+    tasks = [call(idx, prompt) for idx, prompt in enumerate(prompts)]
+    for next_done in asyncio.as_completed(tasks):
+        idx, response = await next_done
+        results[idx] = response
+        
+        completed += 1
+        pbar.update(1)
         
-        pbar.close()
+        # Update estimate every 10 completions
+        if completed % 10 == 0:
+            elapsed = time.time() - start_time
+            rate = completed / elapsed
+            remaining = (len(prompts) - completed) / rate if rate > 0 else 0
+            pbar.set_postfix({
+                'ETA': f'{remaining/60:.1f}m',
+                'Rate': f'{rate:.1f}/s'
+            }, refresh=True)
+    
+    pbar.close()
     
     return results
+
+
+def gemini_call_batch(prompts, max_workers=3, show_progress=True):
+    """
+    Synchronous wrapper around gemini_call_batch_async.
+    
+    Args:
+        prompts: List of prompt strings
+        max_workers: Max in-flight requests (keep low for free tier)
+        show_progress: Show progress bar
+    
+    Returns:
+        List of responses in same order as prompts
+    """
+    if not prompts:
+        return []
+    
+    return asyncio.run(
+        gemini_call_batch_async(prompts, max_workers=max_workers, show_progress=show_progress)
+    )
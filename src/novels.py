@@ -0,0 +1,84 @@
+import os
+import mmap
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from src.chunking import chunk_text
+from src.embeddings import (
+    embed_texts, set_torch_threads, DEVICE, MODEL_NAME, MODEL_DTYPE, MAX_CHUNK_TOKENS
+)
+from src.retrieval import VectorStore, cached_vector_store
+
+NOVEL_FILES = {
+    "castaways": "In search of the castaways.txt",
+    "monte_cristo": "The Count of Monte Cristo.txt",
+}
+
+
+def load_novel(path):
+    # Decode straight from the mapped file, without an intermediate bytes copy
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = str(mm, "utf-8")
+    # Match text-mode universal newlines so chunks and cache keys are unchanged
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+@cached_vector_store(MODEL_NAME, MODEL_DTYPE)
+def build_vector_store(novel_text, max_tokens=MAX_CHUNK_TOKENS, overlap=100, index_type="hnsw_sq"):
+    chunks = chunk_text(novel_text, max_tokens=max_tokens, overlap=overlap)
+    embeddings = embed_texts(chunks)
+    store = VectorStore(embedding_dim=len(embeddings[0]), index_type=index_type)
+    store.add(embeddings, chunks)
+    return store
+
+
+def load_and_build_vector_store(path):
+    return build_vector_store(load_novel(path))
+
+
+def build_novel_stores(data_dir="data"):
+    """
+    Builds one vector store per novel. Cached stores are loaded in this
+    process; when several novels miss the cache on a multi-core CPU, each
+    is built in its own process.
+    """
+    paths = {
+        book: os.path.join(data_dir, "Books", filename)
+        for book, filename in NOVEL_FILES.items()
+    }
+    
+    novels = {}
+    missing = {}
+    for book, path in paths.items():
+        text = load_novel(path)
+        store = build_vector_store.load_cached(text)
+        if store is not None:
+            novels[book] = store
+        else:
+            missing[book] = text
+    
+    # On GPU both workers would share one device, so build in-process
+    cpu_count = os.cpu_count() or 1
+    if len(missing) < 2 or DEVICE == "cuda" or cpu_count < 2:
+        for book, text in missing.items():
+            novels[book] = build_vector_store(text)
+    else:
+        # spawn, not fork: forking after torch has started its thread pools can hang.
+        # Split the cores between workers instead of oversubscribing them.
+        with ProcessPoolExecutor(
+            max_workers=len(missing),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=set_torch_threads,
+            initargs=(max(1, cpu_count // len(missing)),)
+        ) as executor:
+            futures = {
+                book: executor.submit(load_and_build_vector_store, paths[book])
+                for book in missing
+            }
+            for book, future in futures.items():
+                novels[book] = future.result()
+    
+    return {book: novels[book] for book in paths}
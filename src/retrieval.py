@@ -1,18 +1,225 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import tempfile
+
 import faiss
 import numpy as np
 
+CACHE_DIR = os.path.join("models", "cache")
+# Part of every cache key; bump whenever chunking, tokenization or the saved
+# store layout changes so stale entries are rebuilt instead of reused
+CACHE_VERSION = 3
+
+# FAISS wants >= 39 training points per centroid; with 8-bit PQ codes each
+# sub-quantizer has 256 centroids, so smaller corpora train poorly
+IVFPQ_MIN_TRAINING_POINTS = 39 * 256
+
+
+def _to_object_array(texts):
+    # np.array(texts, dtype=object) could build a 2-D array from nested
+    # sequences; filling a 1-D array keeps one element per text
+    arr = np.empty(len(texts), dtype=object)
+    arr[:] = list(texts)
+    return arr
+
 
 class VectorStore:
-    def __init__(self, embedding_dim):
-        self.index = faiss.IndexFlatIP(embedding_dim)
-        self.texts = []
+    """
+    FAISS-backed store of text chunks.
+
+    index_type selects the index:
+    - "hnsw_sq": IndexHNSWSQ graph search over int8 scalar-quantized vectors
+    - "hnsw":    IndexHNSWFlat graph search over full FP32 vectors
+    - "ivfpq":   IndexIVFPQ, product-quantized vectors (trained on the first add)
+
+    IVF-PQ trades recall for memory: it compresses each vector to pq_m bytes,
+    but recall@5 against exact search can fall to ~0.25 when the codebooks
+    are trained on a few thousand chunks. It therefore refuses corpora
+    smaller than IVFPQ_MIN_TRAINING_POINTS. A novel yields only hundreds to
+    a few thousand chunks, so the HNSW variants are the right choice here;
+    "hnsw_sq" keeps recall close to exact (~0.97).
+    """
+
+    def __init__(self, embedding_dim, index_type="hnsw_sq", hnsw_m=32, ef_construction=200,
+                 ef_search=64, nlist=256, pq_m=32, nprobe=16):
+        self.embedding_dim = embedding_dim
+        self.index_type = index_type
+        self.ef_search = ef_search
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.nprobe = nprobe
+        # Object array so search can gather texts with one fancy-index
+        self.texts = np.empty(0, dtype=object)
+
+        if index_type == "hnsw":
+            # HNSW graph over inner product (embeddings are L2-normalized, so IP == cosine)
+            self.index = faiss.IndexHNSWFlat(embedding_dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            self.index.hnsw.efConstruction = ef_construction
+        elif index_type == "hnsw_sq":
+            # Same graph over 8-bit codes; normalized vectors use the int8 range well
+            self.index = faiss.IndexHNSWSQ(
+                embedding_dim, faiss.ScalarQuantizer.QT_8bit, hnsw_m, faiss.METRIC_INNER_PRODUCT
+            )
+            self.index.hnsw.efConstruction = ef_construction
+        elif index_type == "ivfpq":
+            # Built in _train_ivfpq once the training set size is known
+            self.index = None
+        else:
+            raise ValueError(f"Unknown index_type: {index_type!r}")
+
+    def _train_ivfpq(self, embeddings):
+        """
+        Creates and trains the IVF-PQ index on the first batch of vectors.
+        nlist is capped so every inverted list gets enough training points.
+        """
+        n = len(embeddings)
+        if n < IVFPQ_MIN_TRAINING_POINTS:
+            raise ValueError(
+                f"index_type='ivfpq' needs at least {IVFPQ_MIN_TRAINING_POINTS} vectors "
+                f"to train its PQ codebooks, got {n}; use 'hnsw_sq' or 'hnsw' instead"
+            )
+        nlist = max(1, min(self.nlist, n // 39))
+
+        quantizer = faiss.IndexFlatIP(self.embedding_dim)
+        self.index = faiss.IndexIVFPQ(
+            quantizer, self.embedding_dim, nlist, self.pq_m, 8, faiss.METRIC_INNER_PRODUCT
+        )
+        self.index.train(embeddings)
 
     def add(self, embeddings, texts):
-        embeddings = np.array(embeddings).astype("float32")
+        # No-op when embed_texts already returned contiguous float32
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.embedding_dim:
+            raise ValueError(
+                f"Expected embeddings of shape (n, {self.embedding_dim}), got {embeddings.shape}"
+            )
+        if self.index is None:
+            self._train_ivfpq(embeddings)
+        elif not self.index.is_trained:
+            # The scalar quantizer calibrates its value ranges once
+            self.index.train(embeddings)
         self.index.add(embeddings)
-        self.texts.extend(texts)
+        self.texts = np.concatenate([self.texts, _to_object_array(texts)])
+
+    def search(self, query_embeddings, k=5):
+        """
+        Retrieves the top-k texts for each query.
+        Accepts a (nq, d) query matrix and returns an (nq, k) object array of
+        texts, one row per query; a single 1-D query returns one row.
+        If FAISS finds fewer than k hits, rows are trimmed to the real hits.
+        """
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        single = query_embeddings.ndim == 1
+        if single:
+            query_embeddings = query_embeddings[np.newaxis, :]
+
+        if self.index_type in ("hnsw", "hnsw_sq"):
+            self.index.hnsw.efSearch = max(self.ef_search, k)
+        else:
+            self.index.nprobe = min(self.nprobe, self.index.nlist)
+        scores, indices = self.index.search(query_embeddings, k)
+        results = self.texts[indices]
+        # FAISS pads with -1 when fewer than k neighbours are found
+        found = indices >= 0
+        if not found.all():
+            results = [row[mask] for row, mask in zip(results, found)]
+        return results[0] if single else results
+
+    def __getstate__(self):
+        # FAISS indexes are not picklable; ship them as serialized bytes
+        state = self.__dict__.copy()
+        state["index"] = faiss.serialize_index(self.index) if self.index is not None else None
+        return state
+
+    def __setstate__(self, state):
+        if state["index"] is not None:
+            state["index"] = faiss.deserialize_index(state["index"])
+        self.__dict__.update(state)
+
+    def save(self, directory):
+        """
+        Persists the (trained) index and chunk texts so training is one-shot.
+        Files are written to a temporary sibling directory that is renamed into
+        place, so an interrupted save never leaves a partial entry behind.
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+        try:
+            faiss.write_index(self.index, os.path.join(tmp_dir, "index.faiss"))
+            with open(os.path.join(tmp_dir, "chunks.pkl"), "wb") as f:
+                pickle.dump({"index_type": self.index_type, "texts": self.texts}, f)
+
+            # Clear out a partial entry left by an older, non-atomic save
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+            os.replace(tmp_dir, directory)
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory):
+        """Restores a store written by save()."""
+        with open(os.path.join(directory, "chunks.pkl"), "rb") as f:
+            meta = pickle.load(f)
+        index = faiss.read_index(os.path.join(directory, "index.faiss"))
+
+        store = cls(index.d, index_type=meta["index_type"])
+        store.index = index
+        store.texts = _to_object_array(meta["texts"])
+        return store
+
+
+def cached_vector_store(*key_parts, cache_dir=CACHE_DIR):
+    """
+    Decorator that caches build_fn(novel_text, ...) on disk under
+    cache_dir/<sha256>/. The key covers the novel text, every bound argument
+    (defaults included), CACHE_VERSION and key_parts (e.g. the embedding
+    model name), so changing any of them invalidates the cache automatically.
+    """
+    key_parts = (CACHE_VERSION,) + key_parts
+
+    def decorator(build_fn):
+        signature = inspect.signature(build_fn)
+
+        def cache_path(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            novel_text = params.pop(next(iter(signature.parameters)))
+
+            digest = hashlib.sha256(novel_text.encode("utf-8"))
+            digest.update(repr((key_parts, sorted(params.items()))).encode("utf-8"))
+            return os.path.join(cache_dir, digest.hexdigest())
+
+        def load_from(path):
+            # chunks.pkl is written last, so its presence means a complete entry
+            if not os.path.exists(os.path.join(path, "chunks.pkl")):
+                return None
+            print(f"      ✓ Loaded cached vector store ({os.path.basename(path)[:12]})")
+            return VectorStore.load(path)
+
+        def load_cached(*args, **kwargs):
+            """Returns the cached store for these arguments, or None on a miss."""
+            return load_from(cache_path(*args, **kwargs))
+
+        @functools.wraps(build_fn)
+        def wrapper(*args, **kwargs):
+            path = cache_path(*args, **kwargs)
+            store = load_from(path)
+            if store is not None:
+                return store
+
+            store = build_fn(*args, **kwargs)
+            store.save(path)
+            return store
+
+        wrapper.load_cached = load_cached
+        return wrapper
 
-    def search(self, query_embedding, k=5):
-        query_embedding = np.array([query_embedding]).astype("float32")
-        scores, indices = self.index.search(query_embedding, k)
-        return [self.texts[i] for i in indices[0]]
\ No newline at end of file
+    return decorator